@@ -3,41 +3,254 @@ Motor Fault Detection Flask Application - Batch Processing Only
 Handles both single and multiple files through the same batch pipeline.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, send_from_directory, jsonify
 import os
+
+# Pin BLAS/OpenMP pools to one thread before numpy/librosa load (below, via
+# the backend imports): file-level parallelism owns the cores, and
+# N workers x N BLAS threads would oversubscribe and thrash them.
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+from flask import Flask, render_template, request, redirect, url_for, session, send_file, send_from_directory, jsonify, Response, stream_with_context
+import atexit
+import logging
+import shutil
+import tempfile
 import uuid
 import threading
 import time
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
-import pandas as pd
-import json
-from io import BytesIO
+import csv
+import orjson
+from io import StringIO
 
+from backend.audio_io import load_audio
 from backend.spectrograms import generate_all_spectrograms
-from backend.features import extract_all_features
-from backend.utils import save_uploaded_files, clear_session_files, get_upload_path, create_zip_download
+from backend.features import extract_all_features_dict
+from backend.utils import save_uploaded_files, clear_session_files, get_upload_path, get_results_path, iter_zip_download
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
+logger = logging.getLogger(__name__)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Back jsonify with orjson, matching the rest of the JSON pipeline."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
 app.secret_key = 'motor_fault_detection_batch_only_2025'
+app.json = ORJSONProvider(app)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
-ALLOWED_EXTENSIONS = {'wav', 'mp3', 'flac', 'm4a', 'ogg'}
+ALLOWED_EXTENSIONS = frozenset({'wav', 'mp3', 'flac', 'm4a', 'ogg'})
 MAX_FILES_PER_SESSION = 100
 
+# Reject oversized multipart bodies up front; Werkzeug spools uploads above
+# its small in-memory threshold to temp files, so this bounds disk, not RAM
+app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024
+
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
-# Global batch status tracking
+# Global batch status tracking.
+# Each session carries its own lock so worker updates and browser polls for
+# one session never contend with other sessions; the registry lock only
+# guards inserting/removing sessions from the dict.
+class SessionStatus:
+    __slots__ = ('lock', 'data')
+
+    def __init__(self, data):
+        self.lock = threading.Lock()
+        self.data = data
+
 batch_status = {}
-batch_lock = threading.Lock()
+registry_lock = threading.Lock()
+
+# Shared process pool for batch work, created on first use so plain imports
+# (and gunicorn's master) never fork worker processes they don't need
+_executor = None
+_executor_lock = threading.Lock()
+
+def _init_worker():
+    """Prepare a pool worker before it receives real files.
+
+    Pins BLAS/OpenMP to one thread (redundant under fork, where the env is
+    inherited, but keeps spawn-based platforms from nesting BLAS pools
+    inside file-level parallelism) and runs one throwaway pass through the
+    librosa transforms so their numba JIT compilation happens at pool
+    startup instead of inflating the first file's processing time.
+    """
+    os.environ['OMP_NUM_THREADS'] = '1'
+    os.environ['OPENBLAS_NUM_THREADS'] = '1'
+    os.environ['MKL_NUM_THREADS'] = '1'
+    # Persist compiled kernels outside the working tree so the JIT cache
+    # survives restarts without dirtying the repository checkout
+    os.environ.setdefault('NUMBA_CACHE_DIR',
+                          os.path.join(tempfile.gettempdir(), 'numba-cache'))
+
+    import numpy as np
+    import librosa
+    y = np.zeros(22050, dtype=np.float32)
+    librosa.stft(y, n_fft=2048, hop_length=512)
+    librosa.feature.melspectrogram(y=y, sr=22050)
+    librosa.cqt(y, sr=22050, hop_length=512, n_bins=84)
+
+def get_executor():
+    """Return the shared ProcessPoolExecutor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+                _executor = ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_init_worker)
+                atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+def get_session_status(session_id):
+    """Look up the SessionStatus for a session, or None if not tracked."""
+    with registry_lock:
+        return batch_status.get(session_id)
+
+# When REDIS_URL is set, batch status lives in Redis hashes instead of
+# process memory so multiple web workers (or a separate worker process)
+# see the same state. Without it, the in-process store above is used.
+BATCH_STATUS_TTL = 24 * 3600
+
+redis_client = None
+if os.environ.get('REDIS_URL'):
+    import redis
+    redis_client = redis.Redis.from_url(os.environ['REDIS_URL'], decode_responses=True)
+
+def init_session_status(session_id, total_files):
+    """Create the status record for a new batch session."""
+    if redis_client is not None:
+        key = f'batch:{session_id}'
+        pipe = redis_client.pipeline()
+        pipe.delete(key, f'{key}:completed', f'{key}:errors')
+        pipe.hset(key, mapping={
+            'status': 'processing',
+            'current_file': 0,
+            'total_files': total_files,
+            'start_time': time.time(),
+            'current_filename': 'Initializing...',
+            'version': 0
+        })
+        pipe.expire(key, BATCH_STATUS_TTL)
+        pipe.execute()
+        return
+
+    # Sweep expired sessions while we already hold the registry lock, so
+    # abandoned batches age out just like the Redis keys do instead of
+    # accumulating for the life of the process. start_time never changes
+    # after init, so reading it without the per-session lock is safe.
+    cutoff = time.time() - BATCH_STATUS_TTL
+    with registry_lock:
+        stale = [sid for sid, ss in batch_status.items()
+                 if ss.data['start_time'] < cutoff]
+        for sid in stale:
+            del batch_status[sid]
+        batch_status[session_id] = SessionStatus({
+            'status': 'processing',
+            'current_file': 0,
+            'total_files': total_files,
+            'completed_files': [],
+            'errors': [],
+            'start_time': time.time(),
+            'current_filename': 'Initializing...',
+            'version': 0
+        })
+
+def update_session_status(session_id, fields=None, completed_file=None, error=None):
+    """Apply a status mutation and bump the version.
+
+    Returns False when the session is no longer tracked (e.g. cleared
+    mid-batch), so callers can drop late results.
+    """
+    if redis_client is not None:
+        key = f'batch:{session_id}'
+        if not redis_client.exists(key):
+            return False
+        pipe = redis_client.pipeline()
+        if fields:
+            pipe.hset(key, mapping=fields)
+        if completed_file is not None:
+            pipe.rpush(f'{key}:completed', completed_file)
+            pipe.expire(f'{key}:completed', BATCH_STATUS_TTL)
+        if error is not None:
+            pipe.rpush(f'{key}:errors', error)
+            pipe.expire(f'{key}:errors', BATCH_STATUS_TTL)
+        pipe.hincrby(key, 'version', 1)
+        pipe.execute()
+        return True
+
+    ss = get_session_status(session_id)
+    if ss is None:
+        return False
+    with ss.lock:
+        if fields:
+            ss.data.update(fields)
+        if completed_file is not None:
+            ss.data['completed_files'].append(completed_file)
+        if error is not None:
+            ss.data['errors'].append(error)
+        ss.data['version'] += 1
+    return True
+
+def get_status_snapshot(session_id):
+    """Return a plain-dict copy of a session's status, or None."""
+    if redis_client is not None:
+        key = f'batch:{session_id}'
+        data = redis_client.hgetall(key)
+        if not data:
+            return None
+        snapshot = {
+            'status': data.get('status', ''),
+            'current_file': int(data.get('current_file', 0)),
+            'total_files': int(data.get('total_files', 0)),
+            'start_time': float(data.get('start_time', 0)),
+            'current_filename': data.get('current_filename', ''),
+            'version': int(data.get('version', 0)),
+            'completed_files': redis_client.lrange(f'{key}:completed', 0, -1),
+            'errors': redis_client.lrange(f'{key}:errors', 0, -1)
+        }
+        if 'end_time' in data:
+            snapshot['end_time'] = float(data['end_time'])
+        if 'error' in data:
+            snapshot['error'] = data['error']
+        return snapshot
+
+    ss = get_session_status(session_id)
+    if ss is None:
+        return None
+    with ss.lock:
+        return ss.data.copy()
+
+def delete_session_status(session_id):
+    """Drop all status state for a session."""
+    if redis_client is not None:
+        key = f'batch:{session_id}'
+        redis_client.delete(key, f'{key}:completed', f'{key}:errors')
+        return
+    with registry_lock:
+        batch_status.pop(session_id, None)
+
+# endswith against a tuple runs entirely in C with no per-call allocation
+_ALLOWED_SUFFIXES = tuple(f'.{ext}' for ext in sorted(ALLOWED_EXTENSIONS))
 
 def allowed_file(filename):
     """Check if uploaded file has allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
 @app.route('/')
 def index():
@@ -50,22 +263,24 @@ def upload_files():
     # Get files from both possible input names
     files = request.files.getlist('files')  # Multiple files
     single_file = request.files.get('file')  # Single file
-    
-    # Combine both into one list
-    all_files = []
-    if single_file and single_file.filename != '':
-        all_files.append(single_file)
-    if files:
-        all_files.extend([f for f in files if f and f.filename != ''])
-    
-    # Remove duplicates and filter valid files
+
+    candidates = ([single_file] if single_file else []) + files
+
+    # One pass: dedupe on the sanitized lowercased name (so "Motor.WAV" and
+    # "motor.wav " count as one upload) and validate the extension as we go.
+    # The sanitized name travels with the file so the save path does not
+    # have to run secure_filename a second time.
     valid_files = []
     seen_names = set()
-    
-    for file in all_files:
-        if file and file.filename != '' and file.filename not in seen_names and allowed_file(file.filename):
-            valid_files.append(file)
-            seen_names.add(file.filename)
+
+    for file in candidates:
+        if not file or not file.filename:
+            continue
+        sanitized = secure_filename(file.filename)
+        key = sanitized.lower()
+        if key and key not in seen_names and allowed_file(key):
+            valid_files.append((file, sanitized))
+            seen_names.add(key)
     
     if not valid_files:
         return render_template('index.html', 
@@ -79,28 +294,21 @@ def upload_files():
     
     try:
         # Generate unique session ID
+        # The cookie carries only the session id; everything else (progress,
+        # file lists, features) lives server-side in the status store and
+        # results directory, keeping the cookie well under the 4 KB limit.
         session_id = str(uuid.uuid4())
+        session.clear()
         session['session_id'] = session_id
-        session['upload_time'] = datetime.now().isoformat()
-        session['total_files'] = len(valid_files)
         
-        print(f"Processing {len(valid_files)} files in session {session_id}")
+        logger.info("Processing %d files in session %s", len(valid_files), session_id)
         
         # Save uploaded files
         saved_files = save_uploaded_files(valid_files, session_id)
-        print(f"Saved files: {[f['original_name'] for f in saved_files]}")
+        logger.info("Saved files: %s", [f['original_name'] for f in saved_files])
         
         # Initialize batch status
-        with batch_lock:
-            batch_status[session_id] = {
-                'status': 'processing',
-                'current_file': 0,
-                'total_files': len(saved_files),
-                'completed_files': [],
-                'errors': [],
-                'start_time': time.time(),
-                'current_filename': 'Initializing...'
-            }
+        init_session_status(session_id, len(saved_files))
         
         # Start batch processing in background
         thread = threading.Thread(target=process_batch_files, args=(session_id, saved_files))
@@ -110,104 +318,245 @@ def upload_files():
         return redirect(url_for('batch_progress'))
         
     except Exception as e:
-        app.logger.error(f"Upload error: {str(e)}")
-        print(f"Upload error: {str(e)}")
+        app.logger.error("Upload error: %s", e)
         return render_template('index.html', 
                              error=f"Error uploading files: {str(e)}",
                              max_files=MAX_FILES_PER_SESSION)
 
+RESULTS_HASH_INDEX = os.path.join(RESULTS_FOLDER, '_by_hash')
+
+def _copy_cached_results(content_hash, file_results_dir, original_filename, file_id, session_id):
+    """Populate file_results_dir from the content-hash cache if possible.
+
+    The cache is a directory of symlinks results/_by_hash/<sha256> pointing
+    at previously processed result directories. PNGs are hardlinked (falling
+    back to copies) and features.json is rewritten with this file's
+    metadata. Returns True when the cache was usable.
+    """
+    cache_link = os.path.join(RESULTS_HASH_INDEX, content_hash)
+    if not os.path.isdir(cache_link):
+        return False
+
+    try:
+        cached_features_path = os.path.join(cache_link, 'features.json')
+        with open(cached_features_path, 'rb') as f:
+            features_dict = orjson.loads(f.read())
+
+        for name in os.listdir(cache_link):
+            if not name.endswith('.png'):
+                continue
+            src = os.path.join(cache_link, name)
+            dst = os.path.join(file_results_dir, name)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)
+
+        features_dict['filename'] = original_filename
+        features_dict['file_id'] = file_id
+        features_dict['session_id'] = session_id
+
+        features_path = os.path.join(file_results_dir, 'features.json')
+        with open(features_path, 'wb') as f:
+            f.write(orjson.dumps(features_dict, default=str))
+
+        return True
+
+    except (OSError, ValueError) as e:
+        logger.warning("Cache reuse failed for %s: %s", content_hash[:12], e)
+        return False
+
+def _register_cached_results(content_hash, file_results_dir):
+    """Point the content-hash cache at a freshly processed result dir."""
+    os.makedirs(RESULTS_HASH_INDEX, exist_ok=True)
+    cache_link = os.path.join(RESULTS_HASH_INDEX, content_hash)
+
+    # Stale links from cleared sessions are replaced lazily here
+    if os.path.islink(cache_link) and not os.path.isdir(cache_link):
+        os.unlink(cache_link)
+
+    try:
+        # Relative target so cache entries survive the app directory moving
+        os.symlink(os.path.relpath(file_results_dir, RESULTS_HASH_INDEX),
+                   cache_link)
+    except FileExistsError:
+        pass
+
+def _process_one(session_id, file_info):
+    """Process a single file in a worker process.
+
+    Runs in a ProcessPoolExecutor worker, so it must be a top-level function
+    and must not touch batch_status. Returns (original_name, ok, error).
+    """
+    original_filename = file_info['original_name']
+    try:
+        saved_filename = file_info['saved_name']
+        audio_path = get_upload_path(saved_filename, session_id)
+
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Audio file not found: {audio_path}")
+
+        # Create directory for this file's results
+        file_id = saved_filename.split('.')[0]
+        file_results_dir = get_results_path(session_id, file_id)
+        os.makedirs(file_results_dir, exist_ok=True)
+
+        content_hash = file_info.get('content_hash')
+
+        # Reuse cached results when this exact content was processed before;
+        # spectrogram generation dominates the per-file cost
+        if content_hash and _copy_cached_results(content_hash, file_results_dir,
+                                                 original_filename, file_id, session_id):
+            return original_filename, True, None
+
+        # Decode once, share the signal between both stages
+        y, sr = load_audio(audio_path)
+
+        # Generate spectrograms
+        generate_all_spectrograms(audio_path, session_id, file_id, y=y, sr=sr)
+
+        # Extract features
+        features_dict = extract_all_features_dict(audio_path, y=y, sr=sr)
+
+        # Add metadata
+        features_dict['filename'] = original_filename
+        features_dict['file_id'] = file_id
+        features_dict['session_id'] = session_id
+
+        # Save features as JSON (compact orjson; also handles numpy scalars)
+        features_path = os.path.join(file_results_dir, 'features.json')
+        with open(features_path, 'wb') as f:
+            f.write(orjson.dumps(features_dict, option=orjson.OPT_SERIALIZE_NUMPY, default=str))
+
+        if content_hash:
+            _register_cached_results(content_hash, file_results_dir)
+
+        return original_filename, True, None
+
+    except Exception as e:
+        return original_filename, False, str(e)
+
+def write_batch_manifest(session_id):
+    """Walk the session results directory once and persist a manifest.
+
+    The manifest holds everything the results and download views need
+    (file ids, original names, features, spectrogram PNG names), so those
+    views read a single JSON file instead of re-opening every
+    features.json on each request.
+    """
+    results_dir = get_results_path(session_id)
+    manifest = []
+
+    # scandir carries type info with each entry, avoiding the extra stat()
+    # per directory that listdir + isdir/exists probing would cost
+    with os.scandir(results_dir) as it:
+        file_dirs = sorted((entry for entry in it if entry.is_dir()),
+                           key=lambda entry: entry.name)
+
+    for dir_entry in file_dirs:
+        file_id = dir_entry.name
+
+        with os.scandir(dir_entry.path) as it:
+            present = {entry.name for entry in it if entry.is_file()}
+
+        if 'features.json' not in present:
+            continue
+
+        with open(os.path.join(dir_entry.path, 'features.json'), 'rb') as f:
+            features = orjson.loads(f.read())
+
+        spectrograms = sorted(name for name in present
+                              if name.endswith('_spectrogram.png'))
+
+        manifest.append({
+            'file_id': file_id,
+            'original_name': features.get('filename', file_id),
+            'features': features,
+            'spectrograms': spectrograms
+        })
+
+    manifest_path = os.path.join(results_dir, 'manifest.json')
+    with open(manifest_path, 'wb') as f:
+        f.write(orjson.dumps(manifest, default=str))
+
+    # Render the combined CSV once here so downloads serve a ready file
+    # instead of re-serializing the features on every request
+    if manifest:
+        csv_path = os.path.join(results_dir, 'features.csv')
+        fieldnames = list(manifest[0]['features'].keys())
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for entry in manifest:
+                writer.writerow(entry['features'])
+
+    return manifest
+
+def load_batch_manifest(session_id):
+    """Load the session manifest written by write_batch_manifest.
+
+    Returns an empty list when the manifest does not exist (e.g. the
+    session was cleared or processing never completed).
+    """
+    manifest_path = get_results_path(session_id, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return []
+
+    with open(manifest_path, 'rb') as f:
+        return orjson.loads(f.read())
+
 def process_batch_files(session_id, file_list):
-    """Process all files in batch mode."""
+    """Process all files in batch mode using a process pool.
+
+    Spectrogram rendering and feature extraction are CPU-bound and independent
+    per file, so files are fanned out across one worker process per core and
+    batch_status is updated as completions arrive.
+    """
     try:
-        print(f"Starting batch processing for session {session_id}")
-        results_dir = os.path.join('results', session_id)
+        logger.info("Starting batch processing for session %s", session_id)
+        results_dir = get_results_path(session_id)
         os.makedirs(results_dir, exist_ok=True)
-        
-        for i, file_info in enumerate(file_list):
-            print(f"Processing file {i+1}/{len(file_list)}: {file_info['original_name']}")
-            
-            # Update status
-            with batch_lock:
-                if session_id not in batch_status:
-                    print(f"Session {session_id} was cleared, stopping processing")
-                    break
-                
-                batch_status[session_id]['current_file'] = i + 1
-                batch_status[session_id]['current_filename'] = file_info['original_name']
-            
+
+        executor = get_executor()
+        futures = {executor.submit(_process_one, session_id, file_info): file_info
+                   for file_info in file_list}
+
+        for completed, future in enumerate(as_completed(futures), start=1):
+            file_info = futures[future]
             try:
-                # Get file paths
-                original_filename = file_info['original_name']
-                saved_filename = file_info['saved_name']
-                audio_path = get_upload_path(saved_filename, session_id)
-                
-                print(f"Audio path: {audio_path}")
-                
-                if not os.path.exists(audio_path):
-                    raise FileNotFoundError(f"Audio file not found: {audio_path}")
-                
-                # Create directory for this file's results
-                file_id = saved_filename.split('.')[0]
-                file_results_dir = os.path.join(results_dir, file_id)
-                os.makedirs(file_results_dir, exist_ok=True)
-                
-                print(f"Results directory: {file_results_dir}")
-                
-                # Generate spectrograms
-                print(f"Generating spectrograms for {original_filename}")
-                spectrograms = generate_all_spectrograms(audio_path, session_id, file_id)
-                print(f"Generated {len(spectrograms)} spectrograms")
-                
-                # Extract features
-                print(f"Extracting features for {original_filename}")
-                features_df = extract_all_features(audio_path)
-                features_dict = features_df.to_dict('records')[0]
-                
-                # Add metadata
-                features_dict['filename'] = original_filename
-                features_dict['file_id'] = file_id
-                features_dict['session_id'] = session_id
-                
-                # Save features as JSON
-                features_path = os.path.join(file_results_dir, 'features.json')
-                with open(features_path, 'w') as f:
-                    json.dump(features_dict, f, indent=2, default=str)
-                
-                print(f"Saved features to {features_path}")
-                
-                # Update completed files
-                with batch_lock:
-                    if session_id in batch_status:
-                        batch_status[session_id]['completed_files'].append(original_filename)
-                
-                print(f"Completed processing {original_filename}")
-                
+                original_filename, ok, error = future.result()
             except Exception as e:
-                error_msg = f"Error processing {file_info['original_name']}: {str(e)}"
-                print(error_msg)
-                
-                with batch_lock:
-                    if session_id in batch_status:
-                        batch_status[session_id]['errors'].append(error_msg)
-            
-            # Small delay
-            time.sleep(0.1)
-        
+                original_filename, ok, error = file_info['original_name'], False, str(e)
+
+            error_msg = None
+            if not ok:
+                error_msg = f"Error processing {original_filename}: {error}"
+                logger.error("%s", error_msg)
+
+            if not update_session_status(session_id,
+                                         fields={'current_file': completed,
+                                                 'current_filename': original_filename},
+                                         completed_file=original_filename if ok else None,
+                                         error=error_msg):
+                logger.info("Session %s was cleared, dropping result", session_id)
+                continue
+
+            logger.info("Completed %d/%d: %s", completed, len(file_list), original_filename)
+
+        # Write the session manifest so result/download views read one file
+        # instead of rescanning every features.json on each request
+        write_batch_manifest(session_id)
+
         # Mark as completed
-        with batch_lock:
-            if session_id in batch_status:
-                batch_status[session_id]['status'] = 'completed'
-                batch_status[session_id]['end_time'] = time.time()
-                print(f"Batch processing completed for session {session_id}")
-        
+        if update_session_status(session_id, fields={'status': 'completed',
+                                                     'end_time': time.time()}):
+            logger.info("Batch processing completed for session %s", session_id)
+
     except Exception as e:
-        error_msg = f"Batch processing error: {str(e)}"
-        print(error_msg)
-        
-        with batch_lock:
-            if session_id in batch_status:
-                batch_status[session_id]['status'] = 'error'
-                batch_status[session_id]['error'] = str(e)
+        logger.error("Batch processing error: %s", e)
+
+        update_session_status(session_id, fields={'status': 'error',
+                                                  'error': str(e)})
 
 @app.route('/batch_progress')
 def batch_progress():
@@ -217,35 +566,19 @@ def batch_progress():
     
     session_id = session['session_id']
     
-    with batch_lock:
-        if session_id not in batch_status:
-            return redirect(url_for('index'))
-        status = batch_status[session_id].copy()
-    
+    status = get_status_snapshot(session_id)
+    if status is None:
+        return redirect(url_for('index'))
+
     if status['status'] == 'completed':
         return redirect(url_for('results'))
     
-    return render_template('batch_progress.html', 
-                         status=status,
-                         files=session.get('file_names', []))
+    return render_template('batch_progress.html', status=status)
 
-@app.route('/batch_status')
-def get_batch_status():
-    """API endpoint for batch processing status."""
-    if 'session_id' not in session:
-        return jsonify({'error': 'No session found'}), 400
-    
-    session_id = session['session_id']
-    
-    with batch_lock:
-        if session_id not in batch_status:
-            return jsonify({'error': 'No batch found'}), 404
-        status = batch_status[session_id].copy()
-    
-    # Calculate progress percentage
+def _status_payload(status):
+    """Shape a status snapshot into the progress payload the client expects."""
     progress = (status['current_file'] / status['total_files']) * 100 if status['total_files'] > 0 else 0
-    
-    response = {
+    return {
         'status': status['status'],
         'current_file': status['current_file'],
         'total_files': status['total_files'],
@@ -254,8 +587,64 @@ def get_batch_status():
         'errors': status['errors'],
         'current_filename': status.get('current_filename', '')
     }
-    
-    return jsonify(response)
+
+@app.route('/batch_status')
+def get_batch_status():
+    """API endpoint for batch processing status."""
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session found'}), 400
+
+    session_id = session['session_id']
+
+    status = get_status_snapshot(session_id)
+    if status is None:
+        return jsonify({'error': 'No batch found'}), 404
+
+    # Most polls arrive between status changes; answer those with an empty
+    # 304 keyed on the mutation version instead of re-encoding the JSON
+    etag = f'{session_id[:8]}-{status["version"]}'
+    if request.if_none_match.contains(etag):
+        return '', 304
+
+    response = jsonify(_status_payload(status))
+    response.set_etag(etag)
+    return response
+
+@app.route('/batch_events')
+def batch_events():
+    """Push progress over Server-Sent Events instead of client polling.
+
+    The generator watches the status version and emits one event per
+    mutation, so the browser holds a single connection for the whole batch
+    rather than issuing a request every couple of seconds. The version
+    check happens server-side (it must also work against the Redis
+    backend, where a cross-process Event is unavailable), so the cost per
+    idle half-second is one snapshot read, not an HTTP round-trip.
+    """
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session found'}), 400
+
+    session_id = session['session_id']
+
+    def generate():
+        last_version = None
+        while True:
+            status = get_status_snapshot(session_id)
+            if status is None:
+                # Session cleared mid-batch; tell the client not to reconnect
+                yield b'event: gone\ndata: {}\n\n'
+                return
+            if status['version'] != last_version:
+                last_version = status['version']
+                yield b'data: ' + orjson.dumps(_status_payload(status)) + b'\n\n'
+                if status['status'] in ('completed', 'error'):
+                    return
+            time.sleep(0.5)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
 
 @app.route('/results')
 def results():
@@ -266,55 +655,40 @@ def results():
     session_id = session['session_id']
     
     # Check if batch processing is complete
-    with batch_lock:
-        if session_id in batch_status and batch_status[session_id]['status'] != 'completed':
-            return redirect(url_for('batch_progress'))
+    status = get_status_snapshot(session_id)
+    if status is not None and status['status'] != 'completed':
+        return redirect(url_for('batch_progress'))
     
     try:
-        # Load batch results
-        results_dir = os.path.join('results', session_id)
+        # Load batch results from the manifest written at the end of processing
         processed_files = []
-        
-        print(f"Loading results from: {results_dir}")
-        
-        if os.path.exists(results_dir):
-            for file_id in os.listdir(results_dir):
-                file_dir = os.path.join(results_dir, file_id)
-                if os.path.isdir(file_dir):
-                    print(f"Processing results for file_id: {file_id}")
-                    
-                    # Load features to get original filename
-                    features_path = os.path.join(file_dir, 'features.json')
-                    if os.path.exists(features_path):
-                        with open(features_path, 'r') as f:
-                            features = json.load(f)
-                            original_filename = features.get('filename', file_id)
-                        
-                        # Get spectrogram info
-                        spectrograms = {}
-                        spectrogram_types = ['mel', 'cqt', 'log_stft', 'wavelet', 'spectral_kurtosis', 'modulation']
-                        
-                        for spec_type in spectrogram_types:
-                            spec_path = os.path.join(file_dir, f'{spec_type}_spectrogram.png')
-                            if os.path.exists(spec_path):
-                                spectrograms[spec_type] = {
-                                    'name': spec_type.replace('_', ' ').title(),
-                                    'path': url_for('serve_result_file', 
-                                                  session_id=session_id, 
-                                                  file_id=file_id,
-                                                  filename=f'{spec_type}_spectrogram.png')
-                                }
-                        
-                        processed_files.append({
-                            'filename': original_filename,
-                            'file_id': file_id,
-                            'spectrograms': spectrograms,
-                            'features_count': len(features)
-                        })
-                        
-                        print(f"Added processed file: {original_filename} with {len(spectrograms)} spectrograms")
-        
-        print(f"Total processed files: {len(processed_files)}")
+
+        # url_for walks the URL map on every call; with 6 spectrograms per
+        # file that adds up across a large batch. Resolve the route once with
+        # placeholders and fill them per file with string replacement.
+        url_template = url_for('serve_result_file', session_id=session_id,
+                               file_id='__FID__', filename='__FN__')
+
+        for entry in load_batch_manifest(session_id):
+            file_id = entry['file_id']
+            file_url_base = url_template.replace('__FID__', file_id)
+
+            spectrograms = {}
+            for spec_filename in entry['spectrograms']:
+                spec_type = spec_filename[:-len('_spectrogram.png')]
+                spectrograms[spec_type] = {
+                    'name': spec_type.replace('_', ' ').title(),
+                    'path': file_url_base.replace('__FN__', spec_filename)
+                }
+
+            processed_files.append({
+                'filename': entry['original_name'],
+                'file_id': file_id,
+                'spectrograms': spectrograms,
+                'features_count': len(entry['features'])
+            })
+
+        logger.info("Total processed files: %d", len(processed_files))
         
         return render_template('batch_results.html',
                              processed_files=processed_files,
@@ -322,8 +696,7 @@ def results():
                              session_id=session_id)
     
     except Exception as e:
-        app.logger.error(f"Results error: {str(e)}")
-        print(f"Results error: {str(e)}")
+        app.logger.error("Results error: %s", e)
         return render_template('index.html', 
                              error=f"Error loading results: {str(e)}",
                              max_files=MAX_FILES_PER_SESSION)
@@ -335,16 +708,23 @@ def serve_result_file(session_id, file_id, filename):
         if 'session_id' not in session or session['session_id'] != session_id:
             return "Unauthorized", 403
         
-        results_dir = os.path.join(os.getcwd(), 'results', session_id, file_id)
-        
+        results_dir = os.path.join(os.getcwd(), get_results_path(session_id, file_id))
+
         if not os.path.exists(os.path.join(results_dir, filename)):
-            print(f"File not found: {os.path.join(results_dir, filename)}")
+            logger.info("File not found: %s", os.path.join(results_dir, filename))
             return "File not found", 404
-        
-        return send_from_directory(results_dir, filename)
+
+        # Results never change once written (file_id is a fresh UUID per
+        # upload), so the browser may cache them indefinitely; conditional=True
+        # still answers revalidations with 304s.
+        response = send_from_directory(results_dir, filename, conditional=True,
+                                       max_age=31536000)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
     
     except Exception as e:
-        app.logger.error(f"Error serving file {filename}: {str(e)}")
+        app.logger.error("Error serving file %s: %s", filename, e)
         return "Error serving file", 500
 
 @app.route('/download/features/<format>')
@@ -355,42 +735,55 @@ def download_combined_features(format):
     
     session_id = session['session_id']
     
-    # Load all features from files
-    features = []
-    results_dir = os.path.join('results', session_id)
-    
-    if os.path.exists(results_dir):
-        for file_id in os.listdir(results_dir):
-            features_path = os.path.join(results_dir, file_id, 'features.json')
-            if os.path.exists(features_path):
-                with open(features_path, 'r') as f:
-                    features.append(json.load(f))
-    
+    if format == 'csv':
+        # The combined CSV is rendered once when the batch finishes;
+        # serve that file directly when it exists
+        csv_path = get_results_path(session_id, 'features.csv')
+        if os.path.exists(csv_path):
+            return send_file(csv_path,
+                            mimetype='text/csv',
+                            as_attachment=True,
+                            download_name=f'batch_features_{session_id[:8]}.csv')
+
+    # Load all features from the session manifest
+    features = [entry['features'] for entry in load_batch_manifest(session_id)]
+
     if not features:
         return redirect(url_for('index'))
-    
+
     if format == 'csv':
-        df = pd.DataFrame(features)
-        output = BytesIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-        
-        return send_file(output, 
+        # Fallback for sessions processed before the CSV cache existed:
+        # stream one row per file; the feature keys are identical across files
+        fieldnames = list(features[0].keys())
+
+        def generate_csv():
+            buffer = StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for feature_row in features:
+                writer.writerow(feature_row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        return Response(stream_with_context(generate_csv()),
                         mimetype='text/csv',
-                        as_attachment=True,
-                        download_name=f'batch_features_{session_id[:8]}.csv')
-    
+                        headers={'Content-Disposition':
+                                 f'attachment; filename=batch_features_{session_id[:8]}.csv'})
+
     elif format == 'json':
-        output = BytesIO()
-        json_str = json.dumps(features, indent=2, default=str)
-        output.write(json_str.encode())
-        output.seek(0)
-        
-        return send_file(output,
+        def generate_json():
+            yield b'['
+            for i, feature_row in enumerate(features):
+                prefix = b',\n' if i else b''
+                yield prefix + orjson.dumps(feature_row, default=str)
+            yield b']'
+
+        return Response(stream_with_context(generate_json()),
                         mimetype='application/json',
-                        as_attachment=True,
-                        download_name=f'batch_features_{session_id[:8]}.json')
-    
+                        headers={'Content-Disposition':
+                                 f'attachment; filename=batch_features_{session_id[:8]}.json'})
+
     return redirect(url_for('results'))
 
 @app.route('/download/spectrograms')
@@ -402,33 +795,18 @@ def download_spectrograms_zip():
     session_id = session['session_id']
     
     try:
-        # Create file list from directory structure
-        file_list = []
-        results_dir = os.path.join('results', session_id)
-        
-        if os.path.exists(results_dir):
-            for file_id in os.listdir(results_dir):
-                features_path = os.path.join(results_dir, file_id, 'features.json')
-                if os.path.exists(features_path):
-                    with open(features_path, 'r') as f:
-                        features = json.load(f)
-                        file_list.append({
-                            'original_name': features.get('filename', file_id),
-                            'saved_name': f"{file_id}.wav"
-                        })
-        
-        zip_path = create_zip_download(session_id, file_list)
-        
-        if not os.path.exists(zip_path):
-            return "Error creating ZIP file", 500
-        
-        return send_file(zip_path,
+        # Build the file list from the session manifest
+        file_list = [{'original_name': entry['original_name'],
+                      'saved_name': f"{entry['file_id']}.wav"}
+                     for entry in load_batch_manifest(session_id)]
+
+        return Response(stream_with_context(iter_zip_download(session_id, file_list)),
                         mimetype='application/zip',
-                        as_attachment=True,
-                        download_name=f'spectrograms_{session_id[:8]}.zip')
-    
+                        headers={'Content-Disposition':
+                                 f'attachment; filename=spectrograms_{session_id[:8]}.zip'})
+
     except Exception as e:
-        app.logger.error(f"Error creating ZIP download: {str(e)}")
+        app.logger.error("Error creating ZIP download: %s", e)
         return "Error creating download", 500
 
 @app.route('/clear', methods=['POST'])
@@ -438,9 +816,7 @@ def clear_results():
         session_id = session['session_id']
         clear_session_files(session_id)
         
-        with batch_lock:
-            if session_id in batch_status:
-                del batch_status[session_id]
+        delete_session_status(session_id)
     
     session.clear()
     return redirect(url_for('index'))
@@ -453,11 +829,19 @@ def not_found(error):
 
 @app.errorhandler(500)
 def internal_error(error):
-    app.logger.error(f"Internal server error: {str(error)}")
+    app.logger.error("Internal server error: %s", error)
     return render_template('index.html', 
                          error="Internal server error.",
                          max_files=MAX_FILES_PER_SESSION), 500
 
+# Production serving: Flask's built-in server handles one request at a time,
+# so status polls stall behind slow downloads. Run under gunicorn instead:
+#
+#     gunicorn -k gthread -w 1 --threads 8 -b 0.0.0.0:5000 app:app
+#
+# Keep a single web worker (-w 1): batch status lives in this process and the
+# heavy lifting already fans out through the shared process pool.
 if __name__ == '__main__':
+    # Development fallback only
     app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
-    
+
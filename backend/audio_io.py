@@ -0,0 +1,46 @@
+"""
+Shared audio loading for spectrogram generation and feature extraction.
+Decodes each file once and hands the same array to every consumer.
+"""
+
+import os
+
+import librosa
+import soundfile as sf
+
+# Formats libsndfile decodes natively; everything else (mp3, m4a) goes
+# through librosa's audioread fallback
+_SOUNDFILE_EXTENSIONS = {'.wav', '.flac', '.ogg'}
+
+
+def load_audio(audio_path):
+    """
+    Load an audio file at its native sample rate, mono.
+
+    WAV/FLAC/OGG are read straight through soundfile (libsndfile in C),
+    which returns float32 directly and is far faster than the audioread
+    path librosa falls back to. Callers that need the signal in several
+    stages should load once and pass y/sr explicitly, as the batch worker
+    does; results are deliberately not cached here, since holding decoded
+    arrays alive per process costs far more memory than a re-decode saves.
+
+    Args:
+        audio_path: Path to audio file
+
+    Returns:
+        tuple: (y, sr) audio time series and sample rate
+    """
+    extension = os.path.splitext(audio_path)[1].lower()
+
+    if extension in _SOUNDFILE_EXTENSIONS:
+        try:
+            y, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+            if y.ndim == 2:
+                y = y.mean(axis=1)
+            return y, sr
+        except RuntimeError:
+            # Corrupt header or unsupported encoding: fall through to librosa
+            pass
+
+    y, sr = librosa.load(audio_path, sr=None)
+    return y, sr
@@ -3,53 +3,55 @@ Batch processing module for handling multiple audio files.
 Processes files sequentially and organizes results by file.
 """
 
+import logging
 import os
-import json
+import orjson
 import time
+from backend.audio_io import load_audio
 from backend.spectrograms import generate_all_spectrograms
-from backend.features import extract_all_features
-from backend.utils import get_upload_path
+from backend.features import extract_all_features_dict
+from backend.utils import get_upload_path, get_results_path
+
+logger = logging.getLogger(__name__)
 
 class BatchProcessor:
     def __init__(self, session_id, file_list):
         self.session_id = session_id
         self.file_list = file_list
-        self.results_dir = os.path.join('results', session_id)
+        self.results_dir = get_results_path(session_id)
         os.makedirs(self.results_dir, exist_ok=True)
     
     def process_batch(self):
         """Process all files in the batch."""
-        from app import batch_status
-        
+        from app import update_session_status
+
         try:
             for i, file_info in enumerate(self.file_list):
                 original_filename = file_info['original_name']
                 saved_filename = file_info['saved_name']
-                
+
                 # Update status
-                batch_status[self.session_id]['current_file'] = i + 1
-                batch_status[self.session_id]['status'] = 'processing'
-                batch_status[self.session_id]['current_filename'] = original_filename
-                
+                update_session_status(self.session_id,
+                                      fields={'current_file': i + 1,
+                                              'status': 'processing',
+                                              'current_filename': original_filename})
+
                 try:
                     self.process_single_file(saved_filename, original_filename)
-                    batch_status[self.session_id]['completed_files'].append(original_filename)
-                    
+                    update_session_status(self.session_id, completed_file=original_filename)
+
                 except Exception as e:
                     error_msg = f"Error processing {original_filename}: {str(e)}"
-                    batch_status[self.session_id]['errors'].append(error_msg)
-                    print(f"Batch processing error: {error_msg}")
-                
-                # Small delay to prevent overwhelming the system
-                time.sleep(0.1)
-            
+                    update_session_status(self.session_id, error=error_msg)
+                    logger.error("Batch processing error: %s", error_msg)
+
             # Mark as completed
-            batch_status[self.session_id]['status'] = 'completed'
-            batch_status[self.session_id]['end_time'] = time.time()
-            
+            update_session_status(self.session_id, fields={'status': 'completed',
+                                                           'end_time': time.time()})
+
         except Exception as e:
-            batch_status[self.session_id]['status'] = 'error'
-            batch_status[self.session_id]['error'] = str(e)
+            update_session_status(self.session_id, fields={'status': 'error',
+                                                           'error': str(e)})
     
     def process_single_file(self, saved_filename, original_filename):
         """Process a single audio file."""
@@ -64,12 +66,14 @@ class BatchProcessor:
         file_results_dir = os.path.join(self.results_dir, file_id)
         os.makedirs(file_results_dir, exist_ok=True)
         
+        # Decode once, share the signal between both stages
+        y, sr = load_audio(audio_path)
+
         # Generate spectrograms in the file's directory
-        spectrograms = generate_all_spectrograms(audio_path, self.session_id, file_id)
-        
+        spectrograms = generate_all_spectrograms(audio_path, self.session_id, file_id, y=y, sr=sr)
+
         # Extract features
-        features_df = extract_all_features(audio_path)
-        features_dict = features_df.to_dict('records')[0]
+        features_dict = extract_all_features_dict(audio_path, y=y, sr=sr)
         
         # Add metadata
         features_dict['filename'] = original_filename
@@ -78,8 +82,8 @@ class BatchProcessor:
         
         # Save features as JSON in the file's directory
         features_path = os.path.join(file_results_dir, 'features.json')
-        with open(features_path, 'w') as f:
-            json.dump(features_dict, f, indent=2, default=str)
+        with open(features_path, 'wb') as f:
+            f.write(orjson.dumps(features_dict, option=orjson.OPT_SERIALIZE_NUMPY, default=str))
         
         return {
             'filename': original_filename,
@@ -8,13 +8,80 @@ import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 import pywt
+from scipy import fft as sp_fft
 from scipy import signal
 import os
+import logging
+from io import BytesIO
 
-def generate_mel_spectrogram(y, sr, save_path):
+from backend.audio_io import load_audio
+from backend.utils import get_results_path
+
+# Shared STFT parameters: mel, log-STFT, and spectral kurtosis are all
+# derived from the same |STFT|^2, computed once per file
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# CWT setup shared by every scalogram: parsing the wavelet name and building
+# the scales array are pure functions of these constants, so they are done
+# once per process rather than once per file
+CWT_WAVELET = pywt.ContinuousWavelet('morl')
+CWT_SCALES = np.arange(1, 128)
+
+logger = logging.getLogger(__name__)
+
+# One Figure per process, reused across all spectrograms. Allocating a fresh
+# 12x8 Figure per image costs MB-class buffers and axes setup 6 times per
+# file; clearing and redrawing the same one avoids that entirely.
+_figure = None
+
+def _save_figure(save_path):
+    """Render the current figure to PNG and publish it atomically.
+
+    The image is encoded into memory, written to a sibling temp file and
+    moved into place with os.replace, so concurrent readers (the results
+    page, ZIP streaming) never observe a half-written PNG.
+    """
+    buf = BytesIO()
+    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight',
+                facecolor='white', pil_kwargs={'compress_level': 1})
+    tmp_path = save_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buf.getbuffer())
+    os.replace(tmp_path, save_path)
+
+def _pool_columns(arr, max_cols=2000):
+    """Max-pool the time axis of a 2D array down to at most max_cols columns.
+
+    The figures are ~1800 px wide, so handing imshow tens of thousands of
+    columns only makes Agg resample them slowly; max-pooling first keeps
+    transient peaks visible while cutting the rasterization cost.
+    """
+    n_cols = arr.shape[1]
+    if n_cols <= max_cols:
+        return arr
+    factor = -(-n_cols // max_cols)
+    pad = (-n_cols) % factor
+    if pad:
+        arr = np.pad(arr, ((0, 0), (0, pad)), mode='edge')
+    return arr.reshape(arr.shape[0], -1, factor).max(axis=2)
+
+def _begin_figure():
+    """Make the shared Figure current and cleared, creating it on first use."""
+    global _figure
+    if _figure is None:
+        _figure = plt.figure(figsize=(12, 8))
+    else:
+        plt.figure(_figure.number)
+        _figure.clf()
+    return _figure
+
+def generate_mel_spectrogram(y, sr, save_path, S=None):
     """Generate Mel-Spectrogram."""
-    plt.figure(figsize=(12, 8))
-    mel_spec = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=128, fmax=sr//2)
+    _begin_figure()
+    if S is None:
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+    mel_spec = librosa.feature.melspectrogram(S=S, sr=sr, n_mels=128, fmax=sr//2)
     mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
     librosa.display.specshow(mel_spec_db, sr=sr, x_axis='time', y_axis='mel', fmax=sr//2)
     plt.colorbar(format='%+2.0f dB')
@@ -22,12 +89,11 @@ def generate_mel_spectrogram(y, sr, save_path):
     plt.xlabel('Time (s)')
     plt.ylabel('Mel Frequency')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
 
 def generate_cqt_spectrogram(y, sr, save_path):
     """Generate CQT."""
-    plt.figure(figsize=(12, 8))
+    _begin_figure()
     cqt = librosa.cqt(y, sr=sr, hop_length=512, n_bins=84)
     cqt_db = librosa.amplitude_to_db(np.abs(cqt), ref=np.max)
     librosa.display.specshow(cqt_db, sr=sr, x_axis='time', y_axis='cqt_note')
@@ -36,99 +102,127 @@ def generate_cqt_spectrogram(y, sr, save_path):
     plt.xlabel('Time (s)')
     plt.ylabel('CQT Frequency')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
 
-def generate_log_stft_spectrogram(y, sr, save_path):
+def generate_log_stft_spectrogram(y, sr, save_path, S=None):
     """Generate Log-STFT."""
-    plt.figure(figsize=(12, 8))
-    stft = librosa.stft(y, hop_length=512, n_fft=2048)
-    stft_db = librosa.amplitude_to_db(np.abs(stft), ref=np.max)
-    librosa.display.specshow(stft_db, sr=sr, x_axis='time', y_axis='log')
+    _begin_figure()
+    if S is None:
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+    stft_db = librosa.power_to_db(S, ref=np.max)
+    librosa.display.specshow(stft_db, sr=sr, hop_length=HOP_LENGTH, x_axis='time', y_axis='log')
     plt.colorbar(format='%+2.0f dB')
     plt.title('Log-STFT Spectrogram\n(Low-frequency rumble, imbalance, looseness)', fontsize=14)
     plt.xlabel('Time (s)')
     plt.ylabel('Log Frequency (Hz)')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
 
 def generate_wavelet_scalogram(y, sr, save_path):
     """Generate Wavelet Scalogram."""
-    plt.figure(figsize=(12, 8))
+    _begin_figure()
     if len(y) > 50000:
-        y_resampled = signal.resample(y, 50000)
+        # Polyphase FIR decimation by an integer factor is much cheaper than
+        # signal.resample's full-length FFT pair; the factor caps the CWT
+        # input near 50k samples and the effective rate keeps the axes true
+        factor = -(-len(y) // 50000)
+        y_resampled = signal.resample_poly(y, 1, factor)
+        sr = sr / factor
     else:
         y_resampled = y
     
-    scales = np.arange(1, 128)
-    coefficients, frequencies = pywt.cwt(y_resampled, scales, 'morl', sampling_period=1/sr)
+    # FFT-based convolution shares one transform of the signal across all
+    # 127 scales instead of running a time-domain convolution per scale
+    coefficients, frequencies = pywt.cwt(y_resampled, CWT_SCALES, CWT_WAVELET,
+                                         sampling_period=1/sr, method='fft')
     
-    plt.imshow(np.abs(coefficients), extent=[0, len(y_resampled)/sr, frequencies[-1], frequencies[0]], 
+    plt.imshow(_pool_columns(np.abs(coefficients)),
+               extent=[0, len(y_resampled)/sr, frequencies[-1], frequencies[0]],
                cmap='hot', aspect='auto', interpolation='bilinear')
     plt.colorbar(label='Magnitude')
     plt.title('Wavelet Scalogram\n(Short bursts, transient spikes from loose components)', fontsize=14)
     plt.xlabel('Time (s)')
     plt.ylabel('Frequency (Hz)')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
 
-def generate_spectral_kurtosis(y, sr, save_path):
+def generate_spectral_kurtosis(y, sr, save_path, S=None):
     """Generate Spectral Kurtosis."""
-    plt.figure(figsize=(12, 8))
-    f, t, stft = signal.spectrogram(y, sr, nperseg=2048, noverlap=1024)
-    stft_magnitude = np.abs(stft)
-    spectral_kurtosis = np.zeros_like(stft_magnitude)
-    
-    for i in range(stft_magnitude.shape[0]):
-        freq_data = stft_magnitude[i, :]
-        if np.std(freq_data) > 0:
-            mean_val = np.mean(freq_data)
-            std_val = np.std(freq_data)
-            kurtosis_val = np.mean(((freq_data - mean_val) / std_val) ** 4) - 3
-            spectral_kurtosis[i, :] = kurtosis_val
-    
-    plt.imshow(spectral_kurtosis, extent=[t[0], t[-1], f[0], f[-1]], 
+    _begin_figure()
+    if S is None:
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+    stft_magnitude = np.sqrt(S)
+    f = librosa.fft_frequencies(sr=sr, n_fft=N_FFT)
+    t = librosa.frames_to_time(np.arange(stft_magnitude.shape[1]), sr=sr, hop_length=HOP_LENGTH)
+
+    # Excess kurtosis per frequency bin, vectorized across the whole matrix
+    # instead of one numpy call pair per row. Each bin's value is constant
+    # over time, so a single column is enough — imshow stretches it across
+    # the time extent, which is exactly what filling full rows achieved.
+    mean_val = stft_magnitude.mean(axis=1, keepdims=True)
+    std_val = stft_magnitude.std(axis=1, keepdims=True)
+    safe_std = np.where(std_val > 0, std_val, 1)
+    kurtosis_val = (((stft_magnitude - mean_val) / safe_std) ** 4).mean(axis=1) - 3
+    spectral_kurtosis = np.where(std_val[:, 0] > 0, kurtosis_val, 0.0)[:, None]
+
+    plt.imshow(spectral_kurtosis, extent=[t[0], t[-1], f[0], f[-1]],
                cmap='viridis', aspect='auto', origin='lower')
     plt.colorbar(label='Kurtosis')
     plt.title('Spectral Kurtosis\n(Impulses and sudden power shifts)', fontsize=14)
     plt.xlabel('Time (s)')
     plt.ylabel('Frequency (Hz)')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
+
+def _hilbert_envelope(y):
+    """Amplitude envelope |hilbert(y)| via a real forward transform.
+
+    signal.hilbert runs a full complex FFT even though y is real; building
+    the analytic spectrum from rfft halves the forward transform, and
+    padding to the next fast FFT size keeps awkward signal lengths off
+    pocketfft's slow paths. Only the envelope is returned.
+    """
+    n = len(y)
+    n_fft = sp_fft.next_fast_len(n)
+    Y = sp_fft.rfft(y, n=n_fft)
+    spectrum = np.zeros(n_fft, dtype=Y.dtype)
+    spectrum[:Y.size] = Y
+    spectrum[1:(n_fft + 1) // 2] *= 2  # fold negative frequencies in
+    return np.abs(sp_fft.ifft(spectrum)[:n])
 
 def generate_modulation_spectrogram(y, sr, save_path):
     """Generate Modulation Spectrogram."""
-    plt.figure(figsize=(12, 8))
-    analytic_signal = signal.hilbert(y)
-    envelope = np.abs(analytic_signal)
+    _begin_figure()
+    envelope = _hilbert_envelope(y)
     f, t, envelope_spec = signal.spectrogram(envelope, sr, nperseg=2048, noverlap=1024)
     envelope_spec_db = 10 * np.log10(envelope_spec + 1e-10)
     
-    plt.imshow(envelope_spec_db, extent=[t[0], t[-1], f[0], f[-1]], 
+    plt.imshow(_pool_columns(envelope_spec_db), extent=[t[0], t[-1], f[0], f[-1]],
                cmap='plasma', aspect='auto', origin='lower')
     plt.colorbar(label='Power (dB)')
     plt.title('Modulation Spectrogram\n(Wobble or sideband-type modulation from winding faults)', fontsize=14)
     plt.xlabel('Time (s)')
     plt.ylabel('Modulation Frequency (Hz)')
     plt.tight_layout()
-    plt.savefig(save_path, dpi=150, bbox_inches='tight', facecolor='white')
-    plt.close()
+    _save_figure(save_path)
 
-def generate_all_spectrograms(audio_path, session_id, file_id=None):
-    """Generate all spectrograms with proper file handling."""
+def generate_all_spectrograms(audio_path, session_id, file_id=None, y=None, sr=None):
+    """Generate all spectrograms with proper file handling.
+
+    Pass y/sr to reuse an already decoded signal; otherwise the audio is
+    loaded through the shared cache in backend.audio_io.
+    """
     # Load audio
-    y, sr = librosa.load(audio_path, sr=None)
+    if y is None or sr is None:
+        y, sr = load_audio(audio_path)
     
     # Create results directory
     if file_id:
         # Batch processing: each file gets its own folder
-        results_dir = os.path.join('results', session_id, file_id)
+        results_dir = get_results_path(session_id, file_id)
     else:
         # Single file processing: use session directory
-        results_dir = os.path.join('results', session_id)
+        results_dir = get_results_path(session_id)
     
     os.makedirs(results_dir, exist_ok=True)
     
@@ -137,7 +231,8 @@ def generate_all_spectrograms(audio_path, session_id, file_id=None):
         'mel': {
             'name': 'Mel-Spectrogram',
             'description': 'Energy imbalance, tonal shifts, soft degradation patterns',
-            'function': generate_mel_spectrogram
+            'function': generate_mel_spectrogram,
+            'uses_stft': True
         },
         'cqt': {
             'name': 'Constant-Q Transform (CQT)',
@@ -147,7 +242,8 @@ def generate_all_spectrograms(audio_path, session_id, file_id=None):
         'log_stft': {
             'name': 'Log-STFT',
             'description': 'Low-frequency rumble, imbalance, looseness',
-            'function': generate_log_stft_spectrogram
+            'function': generate_log_stft_spectrogram,
+            'uses_stft': True
         },
         'wavelet': {
             'name': 'Wavelet Scalogram',
@@ -157,7 +253,8 @@ def generate_all_spectrograms(audio_path, session_id, file_id=None):
         'spectral_kurtosis': {
             'name': 'Spectral Kurtosis',
             'description': 'Impulses and sudden power shifts',
-            'function': generate_spectral_kurtosis
+            'function': generate_spectral_kurtosis,
+            'uses_stft': True
         },
         'modulation': {
             'name': 'Modulation Spectrogram',
@@ -166,19 +263,27 @@ def generate_all_spectrograms(audio_path, session_id, file_id=None):
         }
     }
     
+    # Compute the power STFT once; mel, log-STFT, and spectral kurtosis are
+    # all linear functions of it, so only cqt/wavelet/modulation still run
+    # their own transforms
+    S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+
     # Generate each spectrogram
     spectrogram_paths = {}
     for spec_type, spec_info in spectrograms.items():
         save_path = os.path.join(results_dir, f'{spec_type}_spectrogram.png')
         try:
-            spec_info['function'](y, sr, save_path)
+            if spec_info.get('uses_stft'):
+                spec_info['function'](y, sr, save_path, S=S)
+            else:
+                spec_info['function'](y, sr, save_path)
             spectrogram_paths[spec_type] = {
                 'path': save_path,
                 'name': spec_info['name'],
                 'description': spec_info['description']
             }
         except Exception as e:
-            print(f"Error generating {spec_type} spectrogram: {str(e)}")
+            logger.error("Error generating %s spectrogram: %s", spec_type, e)
             continue
     
     return spectrogram_paths
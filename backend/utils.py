@@ -2,55 +2,71 @@
 Utility functions for file handling, cleanup, and batch operations.
 """
 
+import hashlib
 import os
 import shutil
 import uuid
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 
 def save_uploaded_files(files, session_id):
     """
     Save multiple uploaded files with unique names but preserve original names.
-    
+
+    Writes are dispatched to a thread pool so large uploads overlap on disk
+    instead of blocking the request thread one file at a time.
+
     Args:
-        files: List of Flask file objects
+        files: List of (Flask file object, sanitized original name) pairs;
+            the name is expected to have been through secure_filename already
         session_id: Unique session identifier
-    
+
     Returns:
         list: List of dictionaries with original and saved filenames
     """
     # Create session directory
     session_dir = os.path.join('uploads', session_id)
     os.makedirs(session_dir, exist_ok=True)
-    
-    saved_files = []
-    
-    for i, file in enumerate(files):
-        # Get original filename
-        original_filename = secure_filename(file.filename)
-        
+
+    def save_one(item):
+        file, original_filename = item
+
         # Generate unique filename for storage
         file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
         unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        
-        # Save file
+
+        # Save file, hashing the content as it streams to disk so duplicate
+        # uploads can reuse cached results instead of reprocessing
         file_path = os.path.join(session_dir, unique_filename)
-        file.save(file_path)
-        
-        # Store file information
-        saved_files.append({
+        digest = hashlib.sha256()
+        with open(file_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        return {
             'original_name': original_filename,
             'saved_name': unique_filename,
-            'file_path': file_path
-        })
-    
+            'file_path': file_path,
+            'content_hash': digest.hexdigest()
+        }
+
+    # File IO releases the GIL, so threads overlap the disk writes while
+    # executor.map keeps the results in input order
+    with ThreadPoolExecutor(max_workers=min(len(files), 8) or 1) as executor:
+        saved_files = list(executor.map(save_one, files))
+
     return saved_files
 
 def save_uploaded_file(file, session_id):
     """
     Save single uploaded file (for backward compatibility).
     """
-    files = save_uploaded_files([file], session_id)
+    files = save_uploaded_files([(file, secure_filename(file.filename))], session_id)
     return files[0] if files else None
 
 def get_upload_path(saved_filename, session_id):
@@ -66,41 +82,95 @@ def get_upload_path(saved_filename, session_id):
     """
     return os.path.join('uploads', session_id, saved_filename)
 
-def create_zip_download(session_id, file_list):
+def get_results_path(session_id, *parts):
     """
-    Create a ZIP file containing all spectrograms organized by file.
-    
+    Get the path to a session's results directory or a file inside it.
+
     Args:
         session_id: Session identifier
-        file_list: List of file information dictionaries
-    
+        *parts: Optional further path components (file_id, filename, ...)
+
     Returns:
-        str: Path to created ZIP file
+        str: Path under results/<session_id>/
     """
-    results_dir = os.path.join('results', session_id)
-    zip_path = os.path.join(results_dir, 'spectrograms.zip')
-    
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+    return os.path.join('results', session_id, *parts)
+
+class _ZipStreamBuffer:
+    """Minimal unseekable write target for building a ZIP incrementally.
+
+    zipfile falls back to data-descriptor entries on unseekable streams,
+    so chunks can be drained and sent to the client as they are written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return b''.join(chunks)
+
+def iter_zip_download(session_id, file_list):
+    """
+    Stream a ZIP of all spectrograms organized by file, yielding byte chunks.
+
+    Entries are Stored rather than Deflated: the PNGs are already
+    DEFLATE-compressed internally, so re-compressing them burns CPU for no
+    size win. Nothing is written to disk and the first bytes ship as soon
+    as the first PNG is read.
+
+    Args:
+        session_id: Session identifier
+        file_list: List of file information dictionaries
+
+    Yields:
+        bytes: Successive chunks of the ZIP stream
+    """
+    results_dir = get_results_path(session_id)
+    buffer = _ZipStreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zipf:
         for file_info in file_list:
             original_filename = file_info['original_name']
             saved_filename = file_info['saved_name']
             file_id = saved_filename.split('.')[0]
-            
+
             # Create folder name based on original filename
             folder_name = original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename
             folder_name = secure_filename(folder_name)  # Make it safe for filesystem
-            
+
             file_results_dir = os.path.join(results_dir, file_id)
-            
-            if os.path.exists(file_results_dir):
-                # Add all spectrograms from this file's directory
-                for filename in os.listdir(file_results_dir):
-                    if filename.endswith('.png'):
-                        file_path = os.path.join(file_results_dir, filename)
-                        archive_path = os.path.join(folder_name, filename)
-                        zipf.write(file_path, archive_path)
-    
-    return zip_path
+
+            # Add all spectrograms from this file's directory; one scandir
+            # pass replaces the exists() probe plus listdir
+            try:
+                with os.scandir(file_results_dir) as it:
+                    png_entries = sorted(entry.path for entry in it
+                                         if entry.name.endswith('.png'))
+            except FileNotFoundError:
+                continue
+
+            for file_path in png_entries:
+                archive_path = os.path.join(folder_name, os.path.basename(file_path))
+                zipf.write(file_path, archive_path)
+                yield buffer.drain()
+
+    # Central directory written on close
+    yield buffer.drain()
 
 def clear_session_files(session_id):
     """
@@ -115,7 +185,7 @@ def clear_session_files(session_id):
         shutil.rmtree(upload_dir)
     
     # Clear results directory
-    results_dir = os.path.join('results', session_id)
+    results_dir = get_results_path(session_id)
     if os.path.exists(results_dir):
         shutil.rmtree(results_dir)
 
@@ -306,9 +306,39 @@ function startProgressTracking() {
         }
     }
     
-    // Start tracking
-    progressInterval = setInterval(updateProgress, 2000);
-    updateProgress(); // Initial call
+    function startPolling() {
+        progressInterval = setInterval(updateProgress, 2000);
+        updateProgress(); // Initial call
+    }
+
+    // Prefer server-sent events (one connection, pushed only on change);
+    // fall back to 2-second polling if the stream cannot be established.
+    if (window.EventSource) {
+        let gotEvent = false;
+        const source = new EventSource('/batch_events');
+        source.onmessage = (e) => {
+            gotEvent = true;
+            const data = JSON.parse(e.data);
+            updateProgressDisplay(data);
+            if (data.status === 'completed' || data.status === 'error') {
+                source.close();
+                if (data.status === 'completed') {
+                    setTimeout(() => {
+                        window.location.href = '/results';
+                    }, 1000);
+                }
+            }
+        };
+        source.addEventListener('gone', () => source.close());
+        source.onerror = () => {
+            if (!gotEvent) {
+                source.close();
+                startPolling();
+            }
+        };
+    } else {
+        startPolling();
+    }
 }
 
 // File Details Toggle